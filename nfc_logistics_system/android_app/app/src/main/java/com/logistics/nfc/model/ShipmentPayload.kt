@@ -205,7 +205,10 @@ data class Security(
     val encryptionKeyId: String,
     
     @SerializedName("checksum")
-    val checksum: String
+    val checksum: String,
+    
+    @SerializedName("checksum_algorithm")
+    val checksumAlgorithm: String
 )
 
 data class Metadata(
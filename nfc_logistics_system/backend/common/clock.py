@@ -0,0 +1,25 @@
+"""
+Clock helpers for NFC Logistics System
+Provides cheap UTC timestamps for message and transaction fields
+"""
+
+import threading
+import time
+
+_cache_lock = threading.Lock()
+_cached_ms = -1
+_cached_iso = ''
+
+
+def utc_now_iso() -> str:
+    """Return the current UTC time as ISO 8601 with millisecond precision and a 'Z' suffix"""
+    global _cached_ms, _cached_iso
+    now_ms = time.time_ns() // 1_000_000
+
+    # Every message built within the same millisecond shares one string
+    with _cache_lock:
+        if now_ms != _cached_ms:
+            seconds, millis = divmod(now_ms, 1000)
+            _cached_iso = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds)) + f'.{millis:03d}Z'
+            _cached_ms = now_ms
+        return _cached_iso
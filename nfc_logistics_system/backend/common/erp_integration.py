@@ -3,18 +3,32 @@ ERP Integration module for NFC Logistics System
 Handles integration with various ERP systems (Infor SyteLine, SAP, etc.)
 """
 
+import asyncio
 import json
 import logging
+import orjson
+import random
 import requests
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from abc import ABC, abstractmethod
+from operator import itemgetter
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
 from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+# (id, quantity) pairs from inventory level rows, fed straight into dict()
+_infor_inventory_row = itemgetter('item_id', 'quantity')
+_sap_inventory_row = itemgetter('material_number', 'available_stock')
+
+T = TypeVar('T')
+
+@dataclass(slots=True, frozen=True)
 class ERPConfig:
     """Configuration for ERP system connection"""
     base_url: str
@@ -23,36 +37,110 @@ class ERPConfig:
     password: str
     timeout: int = 30
     retry_attempts: int = 3
+    retry_backoff_base: float = 0.5  # seconds
+    retry_backoff_max: float = 30.0  # seconds
+    pool_connections: int = 32
+    pool_maxsize: int = 64
+    inventory_cache_ttl: float = 30.0  # seconds
+    executor_workers: int = 16
+
+class JitteredRetry(Retry):
+    """Retry policy that sleeps a random time up to the capped exponential backoff (full jitter)"""
+    
+    def get_backoff_time(self) -> float:
+        # Spreads out callers that failed together so they don't retry against the ERP in lockstep
+        return random.uniform(0, super().get_backoff_time())
 
 class ERPIntegrationError(Exception):
     """Custom exception for ERP integration errors"""
     pass
 
+# Failures an integration method reports instead of raising: transport/ERP errors, plus
+# responses that don't have the expected shape. Anything else is a bug and propagates
+_TRANSIENT_ERRORS = (ERPIntegrationError, requests.RequestException)
+_DATA_ERRORS = (KeyError, ValueError, TypeError)
+
 class BaseERPIntegration(ABC):
     """Abstract base class for ERP integrations"""
     
+    # Endpoint paths by name; subclasses fill this in and calls use the resolved self._endpoints
+    ENDPOINTS: Dict[str, str] = {}
+    
     def __init__(self, config: ERPConfig):
         self.config = config
+        self._endpoints = {name: config.base_url + path for name, path in self.ENDPOINTS.items()}
         self.session = requests.Session()
+        # Keep-alive pool sized for concurrent callers so repeated calls skip the TCP/TLS handshake;
+        # retries with jittered exponential backoff happen inside the pool, on the same connections.
+        # Only throttling/5xx responses and connection/read errors are retried, and Retry-After wins
+        retry = JitteredRetry(
+            total=config.retry_attempts - 1,
+            backoff_factor=config.retry_backoff_base,
+            backoff_max=config.retry_backoff_max,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'POST', 'PUT']),
+            respect_retry_after_header=True
+        )
+        adapter = HTTPAdapter(
+            pool_connections=config.pool_connections,
+            pool_maxsize=config.pool_maxsize,
+            pool_block=False,
+            max_retries=retry
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.session.headers.update({
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {config.api_key}'
         })
+        
+        # Short-lived responses keyed by 'inventory:<ids>', as (expires_at, value)
+        self._cache: Dict[str, Tuple[float, Any]] = {}
+        self._cache_lock = threading.Lock()
+        # When the current token/session must be renewed; None if the ERP gave no lifetime
+        self._auth_expires_at: Optional[float] = None
+        # Bumped each time the ERP issues a new token/session, so callers can tell whether theirs was replaced
+        self._auth_generation = 0
+        self._auth_lock = threading.Lock()
+        # Blocking ERP calls from async callers get their own threads instead of the loop's default pool
+        self._executor = ThreadPoolExecutor(max_workers=config.executor_workers, thread_name_prefix='erp')
     
     @abstractmethod
     def authenticate(self) -> bool:
         """Authenticate with ERP system"""
         pass
     
-    @abstractmethod
     def get_inventory_levels(self, item_ids: List[str]) -> Dict[str, int]:
-        """Get current inventory levels for items"""
+        """Get current inventory levels for items, served from cache for inventory_cache_ttl"""
+        key = 'inventory:' + ','.join(sorted(item_ids))
+        levels = self._cache_get(key)
+        if levels is None:
+            levels = self._fetch_inventory_levels(item_ids)
+            if levels:
+                self._cache_set(key, levels, self.config.inventory_cache_ttl)
+        return dict(levels)
+    
+    @abstractmethod
+    def _fetch_inventory_levels(self, item_ids: List[str]) -> Dict[str, int]:
+        """Get current inventory levels for items from the ERP system"""
         pass
     
     @abstractmethod
+    def bulk_update_inventory(self, updates: List[Dict[str, Any]]) -> Dict[str, bool]:
+        """Update inventory levels for several items in one request.
+        
+        Each update has 'item_id', 'quantity' and 'operation' ('add', 'subtract', 'set');
+        returns success per item_id. Several updates for the same item_id are all sent,
+        but share one entry in the result.
+        """
+        pass
+    
     def update_inventory(self, item_id: str, quantity: int, operation: str) -> bool:
         """Update inventory levels"""
-        pass
+        results = self.bulk_update_inventory([
+            {'item_id': item_id, 'quantity': quantity, 'operation': operation}
+        ])
+        return results.get(item_id, False)
     
     @abstractmethod
     def create_shipment(self, shipment_data: Dict[str, Any]) -> str:
@@ -69,35 +157,117 @@ class BaseERPIntegration(ABC):
         """Release payment for invoice"""
         pass
     
-    def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict[str, Any]:
-        """Make HTTP request with retry logic"""
-        url = f"{self.config.base_url}{endpoint}"
+    async def run_async(self, func: Callable[..., T], *args: Any) -> T:
+        """Run a blocking integration call on the ERP executor so async callers can await or gather it"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+    
+    def close(self) -> None:
+        """Release the pooled ERP connections and the executor threads"""
+        self._executor.shutdown(wait=False)
+        self.session.close()
+    
+    def invalidate(self, prefix: str = '') -> None:
+        """Drop cached responses whose key starts with prefix (everything by default)"""
+        with self._cache_lock:
+            for key in [key for key in self._cache if key.startswith(prefix)]:
+                del self._cache[key]
+    
+    def _cache_get(self, key: str) -> Optional[Any]:
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._cache[key]
+                return None
+            return entry[1]
+    
+    def _cache_set(self, key: str, value: Any, ttl: float) -> None:
+        with self._cache_lock:
+            self._cache[key] = (time.monotonic() + ttl, value)
+    
+    def _set_auth_lifetime(self, expires_in: Optional[float]) -> None:
+        """Schedule renewal a minute before the token/session the ERP just issued expires"""
+        self._auth_generation += 1
+        if expires_in:
+            self._auth_expires_at = time.monotonic() + max(float(expires_in) - 60, 0)
+        else:
+            self._auth_expires_at = None
+    
+    def _reauthenticate(self, stale_generation: int) -> bool:
+        # Concurrent callers share one renewal: only the first one through still holds the old token
+        with self._auth_lock:
+            if self._auth_generation != stale_generation:
+                return True
+            return self.authenticate()
+    
+    def _make_request(self, method: str, url: str, data: Optional[Dict] = None,
+                      reauthenticate: bool = True) -> Dict[str, Any]:
+        """Make HTTP request to a full URL from self._endpoints; retries are handled by the session's adapter"""
+        timeout = self.config.timeout
+        # Serialize once up front; the session already sends Content-Type: application/json
+        body = orjson.dumps(data) if data is not None else None
         
-        for attempt in range(self.config.retry_attempts):
-            try:
+        try:
+            generation = self._auth_generation
+            expires_at = self._auth_expires_at
+            if reauthenticate and expires_at is not None and expires_at <= time.monotonic():
+                self._reauthenticate(generation)
+                generation = self._auth_generation
+            
+            response = self.session.request(
+                method=method,
+                url=url,
+                data=body,
+                timeout=timeout
+            )
+            if response.status_code == 401 and reauthenticate and self._reauthenticate(generation):
                 response = self.session.request(
                     method=method,
                     url=url,
-                    json=data,
-                    timeout=self.config.timeout
+                    data=body,
+                    timeout=timeout
                 )
-                response.raise_for_status()
-                return response.json()
-            except requests.exceptions.RequestException as e:
-                logger.warning(f"Request attempt {attempt + 1} failed: {e}")
-                if attempt == self.config.retry_attempts - 1:
-                    raise ERPIntegrationError(f"Request failed after {self.config.retry_attempts} attempts: {e}")
-                time.sleep(2 ** attempt)  # Exponential backoff
+            response.raise_for_status()
+            # Parse the raw bytes directly instead of decoding the whole body to str first
+            result = orjson.loads(response.content)
+        except requests.exceptions.HTTPError as e:
+            # Statuses the adapter retries raise RetryError once exhausted; this one was never retried
+            raise ERPIntegrationError(f"ERP returned HTTP {e.response.status_code} {e.response.reason} for {url}")
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.RetryError) as e:
+            raise ERPIntegrationError(f"Request failed after {self.config.retry_attempts} attempts: {e}")
+        except requests.exceptions.RequestException as e:
+            raise ERPIntegrationError(f"Request to {url} failed: {e}")
+        except orjson.JSONDecodeError as e:
+            raise ERPIntegrationError(f"Invalid JSON response from {url}: {e}")
+        
+        if not isinstance(result, dict):
+            raise ERPIntegrationError(f"Non-object response from {url}: got {type(result).__name__}")
+        return result
     
     def _handle_erp_response(self, response: Dict[str, Any]) -> Dict[str, Any]:
         """Handle ERP system response and extract data"""
         if 'error' in response:
             raise ERPIntegrationError(f"ERP Error: {response['error']}")
-        return response.get('data', response)
+        data = response.get('data', response)
+        if not isinstance(data, dict):
+            raise ERPIntegrationError(f"Expected an object in ERP response data, got {type(data).__name__}")
+        return data
 
 class InforSyteLineIntegration(BaseERPIntegration):
     """Integration with Infor SyteLine ERP system"""
     
+    ENDPOINTS = {
+        'auth': '/auth/token',
+        'inventory_levels': '/inventory/levels',
+        'inventory_bulk_update': '/inventory/bulk_update',
+        'shipments': '/shipments',
+        'shipment_create': '/shipments/create',
+        'payment_release': '/payments/release'
+    }
+    
     def authenticate(self) -> bool:
         """Authenticate with Infor SyteLine"""
         try:
@@ -107,66 +277,78 @@ class InforSyteLineIntegration(BaseERPIntegration):
                 'grant_type': 'password'
             }
             
-            response = self._make_request('POST', '/auth/token', auth_data)
+            response = self._make_request('POST', self._endpoints['auth'], auth_data, reauthenticate=False)
             token = response.get('access_token')
             
             if token:
                 self.session.headers.update({'Authorization': f'Bearer {token}'})
+                self._set_auth_lifetime(response.get('expires_in'))
                 logger.info("Successfully authenticated with Infor SyteLine")
                 return True
             else:
                 logger.error("Failed to obtain access token from Infor SyteLine")
                 return False
                 
-        except Exception as e:
-            logger.error(f"Infor SyteLine authentication failed: {e}")
+        except (*_TRANSIENT_ERRORS, *_DATA_ERRORS) as e:
+            logger.error(f"Infor SyteLine authentication failed: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
             return False
     
-    def get_inventory_levels(self, item_ids: List[str]) -> Dict[str, int]:
+    def _fetch_inventory_levels(self, item_ids: List[str]) -> Dict[str, int]:
         """Get current inventory levels from Infor SyteLine"""
         try:
-            endpoint = '/inventory/levels'
+            endpoint = self._endpoints['inventory_levels']
             data = {'item_ids': item_ids}
             
             response = self._make_request('POST', endpoint, data)
             response_data = self._handle_erp_response(response)
             
-            inventory_levels = {}
-            for item in response_data.get('items', []):
-                inventory_levels[item['item_id']] = item['quantity']
+            inventory_levels = dict(map(_infor_inventory_row, response_data.get('items', ())))
             
             logger.info(f"Retrieved inventory levels for {len(item_ids)} items")
             return inventory_levels
             
-        except Exception as e:
-            logger.error(f"Failed to get inventory levels from Infor SyteLine: {e}")
+        except (*_TRANSIENT_ERRORS, *_DATA_ERRORS) as e:
+            logger.error(f"Failed to get inventory levels from Infor SyteLine: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
             return {}
     
-    def update_inventory(self, item_id: str, quantity: int, operation: str) -> bool:
+    def bulk_update_inventory(self, updates: List[Dict[str, Any]]) -> Dict[str, bool]:
         """Update inventory in Infor SyteLine"""
         try:
-            endpoint = '/inventory/update'
+            endpoint = self._endpoints['inventory_bulk_update']
+            timestamp = datetime.now().isoformat()
             data = {
-                'item_id': item_id,
-                'quantity': quantity,
-                'operation': operation,  # 'add', 'subtract', 'set'
-                'timestamp': datetime.now().isoformat()
+                'updates': [
+                    {
+                        'item_id': update['item_id'],
+                        'quantity': update['quantity'],
+                        'operation': update['operation'],  # 'add', 'subtract', 'set'
+                        'timestamp': timestamp
+                    }
+                    for update in updates
+                ]
             }
             
             response = self._make_request('POST', endpoint, data)
-            self._handle_erp_response(response)
+            self.invalidate('inventory:')
+            response_data = self._handle_erp_response(response)
             
-            logger.info(f"Successfully updated inventory for item {item_id}")
-            return True
+            # Items the ERP doesn't report on individually succeeded with the request
+            results = {update['item_id']: True for update in updates}
+            for result in response_data.get('results', []):
+                results[result['item_id']] = result.get('success', True)
             
-        except Exception as e:
-            logger.error(f"Failed to update inventory in Infor SyteLine: {e}")
-            return False
+            logger.info(f"Updated inventory for {len(updates)} items")
+            return results
+            
+        except (*_TRANSIENT_ERRORS, *_DATA_ERRORS) as e:
+            logger.error(f"Failed to update inventory in Infor SyteLine: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
+            # A row missing its item_id may be what failed; don't raise again from here
+            return {update.get('item_id'): False for update in updates}
     
     def create_shipment(self, shipment_data: Dict[str, Any]) -> str:
         """Create shipment in Infor SyteLine"""
         try:
-            endpoint = '/shipments/create'
+            endpoint = self._endpoints['shipment_create']
             
             # Format shipment data for Infor SyteLine
             formatted_data = {
@@ -181,20 +363,21 @@ class InforSyteLineIntegration(BaseERPIntegration):
             }
             
             response = self._make_request('POST', endpoint, formatted_data)
+            self.invalidate('inventory:')
             response_data = self._handle_erp_response(response)
             
             shipment_id = response_data.get('shipment_id')
             logger.info(f"Created shipment in Infor SyteLine: {shipment_id}")
             return shipment_id
             
-        except Exception as e:
-            logger.error(f"Failed to create shipment in Infor SyteLine: {e}")
+        except (*_TRANSIENT_ERRORS, *_DATA_ERRORS) as e:
+            logger.error(f"Failed to create shipment in Infor SyteLine: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
             raise ERPIntegrationError(f"Shipment creation failed: {e}")
     
     def update_shipment_status(self, shipment_id: str, status: str) -> bool:
         """Update shipment status in Infor SyteLine"""
         try:
-            endpoint = f'/shipments/{shipment_id}/status'
+            endpoint = f"{self._endpoints['shipments']}/{shipment_id}/status"
             data = {
                 'status': status,
                 'timestamp': datetime.now().isoformat()
@@ -206,14 +389,14 @@ class InforSyteLineIntegration(BaseERPIntegration):
             logger.info(f"Updated shipment {shipment_id} status to {status}")
             return True
             
-        except Exception as e:
-            logger.error(f"Failed to update shipment status in Infor SyteLine: {e}")
+        except (*_TRANSIENT_ERRORS, *_DATA_ERRORS) as e:
+            logger.error(f"Failed to update shipment status in Infor SyteLine: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
             return False
     
     def release_payment(self, invoice_id: str, amount: float) -> bool:
         """Release payment in Infor SyteLine"""
         try:
-            endpoint = '/payments/release'
+            endpoint = self._endpoints['payment_release']
             data = {
                 'invoice_id': invoice_id,
                 'amount': amount,
@@ -227,13 +410,43 @@ class InforSyteLineIntegration(BaseERPIntegration):
             logger.info(f"Released payment for invoice {invoice_id}: ${amount}")
             return True
             
-        except Exception as e:
-            logger.error(f"Failed to release payment in Infor SyteLine: {e}")
+        except (*_TRANSIENT_ERRORS, *_DATA_ERRORS) as e:
+            logger.error(f"Failed to release payment in Infor SyteLine: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
             return False
 
 class SAPIntegration(BaseERPIntegration):
     """Integration with SAP ERP system"""
     
+    ENDPOINTS = {
+        'auth': '/sap/auth',
+        'inventory_query': '/sap/inventory/query',
+        'inventory_movement_bulk': '/sap/inventory/movement_bulk',
+        'shipments': '/sap/shipments',
+        'shipment_create': '/sap/shipments/create',
+        'payment': '/sap/financial/payment'
+    }
+    
+    # Default plant and storage location merged into every goods movement
+    MOVEMENT_DEFAULTS = {
+        'plant': '1000',
+        'storage_location': '0001'
+    }
+    
+    # Operation to SAP movement type
+    SAP_MOVEMENT_TYPES = {
+        'add': '261',      # Goods receipt
+        'subtract': '262',  # Goods issue
+        'set': '309'        # Transfer posting
+    }
+    
+    # Status to SAP delivery status
+    SAP_DELIVERY_STATUSES = {
+        'initiated': 'A',      # Created
+        'in_transit': 'B',     # Partially delivered
+        'delivered': 'C',      # Completely delivered
+        'completed': 'D'       # Completed
+    }
+    
     def authenticate(self) -> bool:
         """Authenticate with SAP"""
         try:
@@ -244,25 +457,26 @@ class SAPIntegration(BaseERPIntegration):
                 'language': 'EN'
             }
             
-            response = self._make_request('POST', '/sap/auth', auth_data)
+            response = self._make_request('POST', self._endpoints['auth'], auth_data, reauthenticate=False)
             session_id = response.get('session_id')
             
             if session_id:
                 self.session.headers.update({'X-SAP-Session': session_id})
+                self._set_auth_lifetime(response.get('expires_in'))
                 logger.info("Successfully authenticated with SAP")
                 return True
             else:
                 logger.error("Failed to obtain session ID from SAP")
                 return False
                 
-        except Exception as e:
-            logger.error(f"SAP authentication failed: {e}")
+        except (*_TRANSIENT_ERRORS, *_DATA_ERRORS) as e:
+            logger.error(f"SAP authentication failed: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
             return False
     
-    def get_inventory_levels(self, item_ids: List[str]) -> Dict[str, int]:
+    def _fetch_inventory_levels(self, item_ids: List[str]) -> Dict[str, int]:
         """Get current inventory levels from SAP"""
         try:
-            endpoint = '/sap/inventory/query'
+            endpoint = self._endpoints['inventory_query']
             data = {
                 'material_numbers': item_ids,
                 'plant': '1000'  # Default plant
@@ -271,44 +485,54 @@ class SAPIntegration(BaseERPIntegration):
             response = self._make_request('POST', endpoint, data)
             response_data = self._handle_erp_response(response)
             
-            inventory_levels = {}
-            for material in response_data.get('materials', []):
-                inventory_levels[material['material_number']] = material['available_stock']
+            inventory_levels = dict(map(_sap_inventory_row, response_data.get('materials', ())))
             
             logger.info(f"Retrieved inventory levels for {len(item_ids)} materials from SAP")
             return inventory_levels
             
-        except Exception as e:
-            logger.error(f"Failed to get inventory levels from SAP: {e}")
+        except (*_TRANSIENT_ERRORS, *_DATA_ERRORS) as e:
+            logger.error(f"Failed to get inventory levels from SAP: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
             return {}
     
-    def update_inventory(self, item_id: str, quantity: int, operation: str) -> bool:
+    def bulk_update_inventory(self, updates: List[Dict[str, Any]]) -> Dict[str, bool]:
         """Update inventory in SAP"""
         try:
-            endpoint = '/sap/inventory/movement'
+            endpoint = self._endpoints['inventory_movement_bulk']
+            defaults = {**self.MOVEMENT_DEFAULTS, 'posting_date': datetime.now().strftime('%Y%m%d')}
+            movement_type = self.SAP_MOVEMENT_TYPES.get
             data = {
-                'material_number': item_id,
-                'quantity': quantity,
-                'movement_type': self._map_operation_to_sap(operation),
-                'plant': '1000',
-                'storage_location': '0001',
-                'posting_date': datetime.now().strftime('%Y%m%d')
+                'movements': [
+                    {
+                        'material_number': update['item_id'],
+                        'quantity': update['quantity'],
+                        'movement_type': movement_type(update['operation'], '261'),
+                        **defaults
+                    }
+                    for update in updates
+                ]
             }
             
             response = self._make_request('POST', endpoint, data)
-            self._handle_erp_response(response)
+            self.invalidate('inventory:')
+            response_data = self._handle_erp_response(response)
             
-            logger.info(f"Successfully updated inventory for material {item_id} in SAP")
-            return True
+            # Materials SAP doesn't report on individually succeeded with the request
+            results = {update['item_id']: True for update in updates}
+            for result in response_data.get('results', []):
+                results[result['material_number']] = result.get('success', True)
             
-        except Exception as e:
-            logger.error(f"Failed to update inventory in SAP: {e}")
-            return False
+            logger.info(f"Updated inventory for {len(updates)} materials in SAP")
+            return results
+            
+        except (*_TRANSIENT_ERRORS, *_DATA_ERRORS) as e:
+            logger.error(f"Failed to update inventory in SAP: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
+            # A row missing its item_id may be what failed; don't raise again from here
+            return {update.get('item_id'): False for update in updates}
     
     def create_shipment(self, shipment_data: Dict[str, Any]) -> str:
         """Create shipment in SAP"""
         try:
-            endpoint = '/sap/shipments/create'
+            endpoint = self._endpoints['shipment_create']
             
             # Format shipment data for SAP
             formatted_data = {
@@ -321,22 +545,23 @@ class SAPIntegration(BaseERPIntegration):
             }
             
             response = self._make_request('POST', endpoint, formatted_data)
+            self.invalidate('inventory:')
             response_data = self._handle_erp_response(response)
             
             delivery_number = response_data.get('delivery_number')
             logger.info(f"Created delivery in SAP: {delivery_number}")
             return delivery_number
             
-        except Exception as e:
-            logger.error(f"Failed to create shipment in SAP: {e}")
+        except (*_TRANSIENT_ERRORS, *_DATA_ERRORS) as e:
+            logger.error(f"Failed to create shipment in SAP: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
             raise ERPIntegrationError(f"Shipment creation failed: {e}")
     
     def update_shipment_status(self, shipment_id: str, status: str) -> bool:
         """Update shipment status in SAP"""
         try:
-            endpoint = f'/sap/shipments/{shipment_id}/status'
+            endpoint = f"{self._endpoints['shipments']}/{shipment_id}/status"
             data = {
-                'status': self._map_status_to_sap(status),
+                'status': self.SAP_DELIVERY_STATUSES.get(status, 'A'),
                 'timestamp': datetime.now().isoformat()
             }
             
@@ -346,14 +571,14 @@ class SAPIntegration(BaseERPIntegration):
             logger.info(f"Updated shipment {shipment_id} status to {status} in SAP")
             return True
             
-        except Exception as e:
-            logger.error(f"Failed to update shipment status in SAP: {e}")
+        except (*_TRANSIENT_ERRORS, *_DATA_ERRORS) as e:
+            logger.error(f"Failed to update shipment status in SAP: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
             return False
     
     def release_payment(self, invoice_id: str, amount: float) -> bool:
         """Release payment in SAP"""
         try:
-            endpoint = '/sap/financial/payment'
+            endpoint = self._endpoints['payment']
             data = {
                 'invoice_number': invoice_id,
                 'amount': amount,
@@ -368,40 +593,21 @@ class SAPIntegration(BaseERPIntegration):
             logger.info(f"Released payment for invoice {invoice_id}: ${amount} in SAP")
             return True
             
-        except Exception as e:
-            logger.error(f"Failed to release payment in SAP: {e}")
+        except (*_TRANSIENT_ERRORS, *_DATA_ERRORS) as e:
+            logger.error(f"Failed to release payment in SAP: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
             return False
     
-    def _map_operation_to_sap(self, operation: str) -> str:
-        """Map operation to SAP movement type"""
-        mapping = {
-            'add': '261',      # Goods receipt
-            'subtract': '262',  # Goods issue
-            'set': '309'        # Transfer posting
-        }
-        return mapping.get(operation, '261')
-    
-    def _map_status_to_sap(self, status: str) -> str:
-        """Map status to SAP delivery status"""
-        mapping = {
-            'initiated': 'A',      # Created
-            'in_transit': 'B',     # Partially delivered
-            'delivered': 'C',      # Completely delivered
-            'completed': 'D'       # Completed
-        }
-        return mapping.get(status, 'A')
-    
     def _format_sap_items(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Format items for SAP delivery"""
-        formatted_items = []
-        for item in items:
-            formatted_items.append({
+        return [
+            {
                 'material_number': item['item_id'],
                 'quantity': item['quantity'],
                 'unit': 'EA',  # Each
                 'plant': '1000'
-            })
-        return formatted_items
+            }
+            for item in items
+        ]
 
 class ERPIntegrationFactory:
     """Factory for creating ERP integration instances"""
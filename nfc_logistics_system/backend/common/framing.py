@@ -0,0 +1,36 @@
+"""
+Message framing for NFC Logistics System
+Each socket message is a 4-byte big-endian length followed by the body
+"""
+
+import asyncio
+import struct
+from typing import Optional
+
+FRAME_HEADER = struct.Struct('>I')
+# Largest body a peer may announce; anything bigger is refused before reading it
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """Read one message body; returns None if the peer closed cleanly between messages"""
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise ConnectionError('Connection closed mid-frame') from e
+
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ConnectionError(f'Frame of {size} bytes exceeds the {MAX_FRAME_SIZE} byte limit')
+    try:
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError as e:
+        raise ConnectionError('Connection closed mid-frame') from e
+
+
+def write_frame(writer: asyncio.StreamWriter, body: bytes) -> None:
+    """Queue one message on the writer; the caller still awaits drain()"""
+    # Hand header and body over separately so the transport can gather-write them
+    writer.writelines((FRAME_HEADER.pack(len(body)), body))
@@ -3,22 +3,38 @@ Security module for NFC Logistics System
 Handles digital signatures, encryption, and authentication
 """
 
+import asyncio
+import binascii
 import hashlib
 import hmac
-import json
+import itertools
 import logging
 import os
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional
-import base64
+import orjson
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
 
+from common.clock import utc_now_iso
+
 logger = logging.getLogger(__name__)
 
+# RSA signature parameters are immutable; build them once instead of per sign/verify
+RSA_SIGNATURE_HASH = hashes.SHA256()
+RSA_PSS_PADDING = padding.PSS(
+    mgf=padding.MGF1(hashes.SHA256()),
+    salt_length=padding.PSS.MAX_LENGTH
+)
+
+def b64encode(data: bytes) -> str:
+    """Base64-encode bytes straight to an ASCII str, without a trailing newline"""
+    return binascii.b2a_base64(data, newline=False).decode('ascii')
+
 class SecurityManager:
     """Manages security operations for the NFC logistics system"""
     
@@ -26,25 +42,41 @@ class SecurityManager:
         self.private_key = None
         self.public_key = None
         self.encryption_key = os.urandom(32)  # AES-256 key
+        self._aesgcm = AESGCM(self.encryption_key)
+        
+        # Transaction IDs: clock + per-process random node + counter, no syscall per ID
+        self._txn_node = os.urandom(2).hex().upper()
+        self._txn_counter = itertools.count()
+        
+        # OpenSSL releases the GIL while signing/verifying, so a small pool runs these in parallel
+        self._crypto_pool = ThreadPoolExecutor(
+            max_workers=min(8, os.cpu_count() or 4),
+            thread_name_prefix='crypto'
+        )
         
         if private_key_path and os.path.exists(private_key_path):
             self.load_private_key(private_key_path)
         if public_key_path and os.path.exists(public_key_path):
             self.load_public_key(public_key_path)
     
-    def generate_key_pair(self, key_size: int = 2048) -> tuple:
-        """Generate RSA key pair for digital signatures"""
-        private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=key_size,
-            backend=default_backend()
-        )
+    def generate_key_pair(self, key_size: int = 2048, algorithm: str = 'ed25519') -> tuple:
+        """Generate key pair for digital signatures ('ed25519' or 'rsa'; key_size applies to RSA)"""
+        if algorithm == 'ed25519':
+            private_key = Ed25519PrivateKey.generate()
+        elif algorithm == 'rsa':
+            private_key = rsa.generate_private_key(
+                public_exponent=65537,
+                key_size=key_size,
+                backend=default_backend()
+            )
+        else:
+            raise ValueError(f"Unsupported signature algorithm: {algorithm}")
         public_key = private_key.public_key()
         
         return private_key, public_key
     
     def save_key_pair(self, private_key, public_key, private_path: str, public_path: str):
-        """Save RSA key pair to files"""
+        """Save key pair to files"""
         # Save private key
         with open(private_path, 'wb') as f:
             f.write(private_key.private_bytes(
@@ -85,49 +117,61 @@ class SecurityManager:
         except Exception as e:
             logger.error(f"Failed to load public key: {e}")
     
+    def _canonicalize(self, data: Dict[str, Any]) -> bytes:
+        """Serialize data to the canonical form covered by signatures and checksums"""
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+    
+    @property
+    def signature_algorithm(self) -> str:
+        """Name of the scheme create_digital_signature uses with the loaded private key"""
+        if isinstance(self.private_key, Ed25519PrivateKey):
+            return 'Ed25519'
+        return 'SHA256withRSA'
+    
     def create_digital_signature(self, data: Dict[str, Any]) -> str:
         """Create digital signature for payload data"""
+        return self._sign_bytes(self._canonicalize(data))
+    
+    def _sign_bytes(self, data_bytes: bytes) -> str:
+        """Create digital signature over already canonicalized data"""
         if not self.private_key:
             raise ValueError("Private key not loaded")
         
-        # Convert data to canonical JSON string
-        json_str = json.dumps(data, sort_keys=True, separators=(',', ':'))
-        data_bytes = json_str.encode('utf-8')
+        # Create signature; RSA keys loaded from older deployments still sign with PSS
+        if isinstance(self.private_key, Ed25519PrivateKey):
+            return b64encode(self.private_key.sign(data_bytes))
         
-        # Create signature
         signature = self.private_key.sign(
             data_bytes,
-            padding.PSS(
-                mgf=padding.MGF1(hashes.SHA256()),
-                salt_length=padding.PSS.MAX_LENGTH
-            ),
-            hashes.SHA256()
+            RSA_PSS_PADDING,
+            RSA_SIGNATURE_HASH
         )
         
-        return base64.b64encode(signature).decode('utf-8')
+        return b64encode(signature)
     
     def verify_digital_signature(self, data: Dict[str, Any], signature: str) -> bool:
         """Verify digital signature of payload data"""
+        return self._verify_bytes(self._canonicalize(data), signature)
+    
+    def _verify_bytes(self, data_bytes: bytes, signature: str) -> bool:
+        """Verify digital signature over already canonicalized data"""
         if not self.public_key:
             raise ValueError("Public key not loaded")
         
         try:
-            # Convert data to canonical JSON string
-            json_str = json.dumps(data, sort_keys=True, separators=(',', ':'))
-            data_bytes = json_str.encode('utf-8')
-            
             # Decode signature
-            signature_bytes = base64.b64decode(signature)
+            signature_bytes = binascii.a2b_base64(signature)
             
             # Verify signature
+            if isinstance(self.public_key, Ed25519PublicKey):
+                self.public_key.verify(signature_bytes, data_bytes)
+                return True
+            
             self.public_key.verify(
                 signature_bytes,
                 data_bytes,
-                padding.PSS(
-                    mgf=padding.MGF1(hashes.SHA256()),
-                    salt_length=padding.PSS.MAX_LENGTH
-                ),
-                hashes.SHA256()
+                RSA_PSS_PADDING,
+                RSA_SIGNATURE_HASH
             )
             return True
         except Exception as e:
@@ -135,108 +179,87 @@ class SecurityManager:
             return False
     
     def encrypt_payload(self, payload: Dict[str, Any]) -> str:
-        """Encrypt payload data using AES-256"""
-        json_str = json.dumps(payload)
-        data_bytes = json_str.encode('utf-8')
-        
-        # Generate random IV
-        iv = os.urandom(16)
-        
-        # Create cipher
-        cipher = Cipher(algorithms.AES(self.encryption_key), modes.CBC(iv), backend=default_backend())
-        encryptor = cipher.encryptor()
+        """Encrypt payload data using AES-256-GCM"""
+        data_bytes = orjson.dumps(payload)
         
-        # Pad data to block size
-        padded_data = self._pad_data(data_bytes)
+        # Generate random 96-bit nonce
+        nonce = os.urandom(12)
         
-        # Encrypt
-        encrypted_data = encryptor.update(padded_data) + encryptor.finalize()
+        # Encrypt and authenticate in one pass; the tag is appended to the ciphertext
+        encrypted_data = self._aesgcm.encrypt(nonce, data_bytes, None)
         
-        # Combine IV and encrypted data
-        combined = iv + encrypted_data
-        return base64.b64encode(combined).decode('utf-8')
+        # Combine nonce and encrypted data
+        combined = nonce + encrypted_data
+        return b64encode(combined)
     
     def decrypt_payload(self, encrypted_data: str) -> Dict[str, Any]:
-        """Decrypt payload data using AES-256"""
-        combined = base64.b64decode(encrypted_data)
+        """Decrypt payload data using AES-256-GCM"""
+        combined = binascii.a2b_base64(encrypted_data)
         
-        # Extract IV and encrypted data
-        iv = combined[:16]
-        encrypted = combined[16:]
+        # Extract nonce and encrypted data
+        nonce = combined[:12]
+        encrypted = combined[12:]
         
-        # Create cipher
-        cipher = Cipher(algorithms.AES(self.encryption_key), modes.CBC(iv), backend=default_backend())
-        decryptor = cipher.decryptor()
-        
-        # Decrypt
-        decrypted_data = decryptor.update(encrypted) + decryptor.finalize()
-        
-        # Remove padding
-        unpadded_data = self._unpad_data(decrypted_data)
+        # Decrypt; raises InvalidTag if the data was tampered with
+        decrypted_data = self._aesgcm.decrypt(nonce, encrypted, None)
         
         # Parse JSON
-        json_str = unpadded_data.decode('utf-8')
-        return json.loads(json_str)
-    
-    def _pad_data(self, data: bytes) -> bytes:
-        """Add PKCS7 padding to data"""
-        block_size = 16
-        padding_length = block_size - (len(data) % block_size)
-        padding = bytes([padding_length] * padding_length)
-        return data + padding
-    
-    def _unpad_data(self, data: bytes) -> bytes:
-        """Remove PKCS7 padding from data"""
-        padding_length = data[-1]
-        return data[:-padding_length]
+        return orjson.loads(decrypted_data)
     
     def generate_checksum(self, data: Dict[str, Any]) -> str:
-        """Generate MD5 checksum for data integrity"""
-        json_str = json.dumps(data, sort_keys=True, separators=(',', ':'))
-        return hashlib.md5(json_str.encode('utf-8')).hexdigest()
+        """Generate SHA-256 checksum for data integrity"""
+        return self._checksum_bytes(self._canonicalize(data))
+    
+    def _checksum_bytes(self, data_bytes: bytes) -> str:
+        """Generate SHA-256 checksum over already canonicalized data"""
+        return hashlib.sha256(data_bytes).hexdigest()
     
     def verify_checksum(self, data: Dict[str, Any], checksum: str) -> bool:
-        """Verify MD5 checksum for data integrity"""
-        expected_checksum = self.generate_checksum(data)
-        return hmac.compare_digest(expected_checksum, checksum)
+        """Verify SHA-256 checksum for data integrity"""
+        return self._verify_checksum_bytes(self._canonicalize(data), checksum)
+    
+    def _verify_checksum_bytes(self, data_bytes: bytes, checksum: str) -> bool:
+        """Verify SHA-256 checksum over already canonicalized data"""
+        return hmac.compare_digest(self._checksum_bytes(data_bytes), checksum)
     
     def generate_transaction_id(self, prefix: str = "TXN") -> str:
         """Generate unique transaction ID"""
-        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-        random_suffix = os.urandom(4).hex().upper()
-        return f"{prefix}-{timestamp}-{random_suffix}"
+        return f"{prefix}-{time.time_ns():016X}-{self._txn_node}{next(self._txn_counter):06X}"
     
-    def create_secure_payload(self, payload: Dict[str, Any]) -> Dict[str, Any]:
-        """Create a secure payload with digital signature and encryption"""
-        # Add security metadata
-        secure_payload = payload.copy()
+    def create_secure_payload(self, payload: Dict[str, Any], now: Optional[str] = None) -> Dict[str, Any]:
+        """Create a secure payload with digital signature and encryption, stamped with now (default: the current time)"""
+        # One clock reading stamps the transaction, the signature and the key ID
+        if now is None:
+            now = utc_now_iso()
         
-        # Generate transaction ID if not present
-        if 'transaction' not in secure_payload:
-            secure_payload['transaction'] = {}
-        if 'transaction_id' not in secure_payload['transaction']:
-            secure_payload['transaction']['transaction_id'] = self.generate_transaction_id()
+        # Layer fresh transaction/security sections over the input instead of copying it and
+        # mutating nested dicts that are still shared with the caller
+        transaction = {**payload.get('transaction', {}), 'timestamp': now}
+        if 'transaction_id' not in transaction:
+            transaction['transaction_id'] = self.generate_transaction_id()
+        secure_payload = {**payload, 'transaction': transaction}
         
-        # Add timestamp
-        secure_payload['transaction']['timestamp'] = datetime.now().isoformat() + 'Z'
+        # Signature and checksum cover everything except the security section;
+        # serialize it once and reuse the bytes for both
+        security = secure_payload.pop('security', {})
+        data_bytes = self._canonicalize(secure_payload)
         
         # Create digital signature
-        signature = self.create_digital_signature(secure_payload)
+        signature = self._sign_bytes(data_bytes)
         
         # Generate checksum
-        checksum = self.generate_checksum(secure_payload)
+        checksum = self._checksum_bytes(data_bytes)
         
         # Add security information
-        if 'security' not in secure_payload:
-            secure_payload['security'] = {}
-        
-        secure_payload['security'].update({
+        secure_payload['security'] = {
+            **security,
             'digital_signature': signature,
-            'signature_algorithm': 'SHA256withRSA',
-            'signature_timestamp': datetime.now().isoformat() + 'Z',
-            'encryption_key_id': 'KEY-' + datetime.now().strftime("%Y%m%d"),
-            'checksum': checksum
-        })
+            'signature_algorithm': self.signature_algorithm,
+            'signature_timestamp': now,
+            'encryption_key_id': 'KEY-' + now[:10].replace('-', ''),
+            'checksum': checksum,
+            'checksum_algorithm': 'SHA256'
+        }
         
         return secure_payload
     
@@ -247,20 +270,26 @@ class SecurityManager:
             if 'security' not in payload:
                 return False, "Missing security section"
             
-            security = payload['security']
+            # Detach the section in place instead of copying the payload; it is
+            # restored below, so the dict must not see concurrent writers meanwhile
+            security = payload.pop('security')
+            try:
+                data_bytes = self._canonicalize(payload)
+            finally:
+                payload['security'] = security
             
             # Verify checksum
             if 'checksum' not in security:
                 return False, "Missing checksum"
             
-            if not self.verify_checksum(payload, security['checksum']):
+            if not self._verify_checksum_bytes(data_bytes, security['checksum']):
                 return False, "Checksum verification failed"
             
             # Verify digital signature
             if 'digital_signature' not in security:
                 return False, "Missing digital signature"
             
-            if not self.verify_digital_signature(payload, security['digital_signature']):
+            if not self._verify_bytes(data_bytes, security['digital_signature']):
                 return False, "Digital signature verification failed"
             
             return True, "Payload validation successful"
@@ -269,5 +298,15 @@ class SecurityManager:
             logger.error(f"Payload validation error: {e}")
             return False, f"Validation error: {str(e)}"
 
+    async def async_create_secure_payload(self, payload: Dict[str, Any], now: Optional[str] = None) -> Dict[str, Any]:
+        """Create a secure payload on the crypto pool without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._crypto_pool, self.create_secure_payload, payload, now)
+    
+    async def async_validate_secure_payload(self, payload: Dict[str, Any]) -> tuple[bool, str]:
+        """Validate a secure payload on the crypto pool without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._crypto_pool, self.validate_secure_payload, payload)
+
 # Global security manager instance
 security_manager = SecurityManager()
\ No newline at end of file
@@ -4,21 +4,28 @@ Handles shipment completion and ERP integration with SAP
 """
 
 import asyncio
-import json
 import logging
 import socket
 import sys
 import os
-from datetime import datetime
-from typing import Dict, Any, Optional
-import threading
-import time
+from collections import OrderedDict
+from typing import Dict, Any, List
+
+import orjson
+from pydantic import BaseModel, Field, ValidationError
+
+try:
+    import uvloop
+except ImportError:  # not available on Windows
+    uvloop = None
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from common.clock import utc_now_iso
+from common.framing import read_frame, write_frame
 from common.security import SecurityManager
-from common.erp_integration import ERPIntegrationFactory, MOCK_ERP_CONFIGS, ERPConfig
+from common.erp_integration import ERPIntegrationFactory, MOCK_ERP_CONFIGS
 
 # Configure logging
 logging.basicConfig(
@@ -31,6 +38,62 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Shipments allowed to hold SAP transactions at once; the rest wait their turn
+MAX_ERP_TRANSACTIONS = 16
+
+# Completed shipments remembered for status queries; the oldest are forgotten first
+MAX_TRACKED_SHIPMENTS = 10_000
+
+# Fixed parts of every completion response, shared rather than rebuilt per shipment
+RECEIVER_LOCATION = {
+    'latitude': 39.9612,  # Columbus, OH coordinates
+    'longitude': -82.9988,
+    'address': '456 Distribution Center Blvd',
+    'city': 'Columbus',
+    'state': 'OH',
+    'zip_code': '43215'
+}
+COMPLETION_METADATA = {
+    'version': '1.0',
+    'processed_by': 'receiver_bridge'
+}
+
+# Reply to an unparseable frame, serialized once; it carries no timestamp since
+# the client has nothing to correlate it with
+INVALID_JSON_RESPONSE = orjson.dumps({
+    'status': 'error',
+    'message': 'Invalid JSON format'
+})
+
+class DeliveryTransaction(BaseModel):
+    """Transaction section of a delivered payload"""
+    transaction_id: str = Field(min_length=1)
+
+class DeliveryItem(BaseModel):
+    """Packing slip line the receiver books into inventory"""
+    item_id: str
+    quantity: float
+
+class DeliveryPackingSlip(BaseModel):
+    """Packing slip section of a delivered payload"""
+    items: List[DeliveryItem] = []
+
+class DeliveryBillOfLading(BaseModel):
+    """Bill of lading section of a delivered payload"""
+    bol_number: str
+
+class DeliveryERPIdentifiers(BaseModel):
+    """ERP identifiers section of a delivered payload"""
+    receiver_erp_id: str = Field(min_length=1)
+    receiver_erp_type: str
+
+class DeliveryPayload(BaseModel):
+    """Fields the receiver reads from a delivered payload; other fields pass through unchecked"""
+    transaction: DeliveryTransaction
+    packing_slip: DeliveryPackingSlip
+    bill_of_lading: DeliveryBillOfLading
+    erp_identifiers: DeliveryERPIdentifiers
+
 class ReceiverBridge:
     """Receiver bridge server for NFC logistics system"""
     
@@ -39,10 +102,10 @@ class ReceiverBridge:
         self.port = port
         self.security_manager = SecurityManager()
         self.erp_integration = None
-        self.server_socket = None
-        self.running = False
-        self.active_connections = []
-        self.pending_shipments = {}  # Track pending shipments
+        self.server = None
+        self.client_tasks = set()
+        self.pending_shipments = OrderedDict()  # Track pending shipments, oldest first
+        self.erp_slots = asyncio.Semaphore(MAX_ERP_TRANSACTIONS)
         
         # Initialize ERP integration
         self._initialize_erp()
@@ -65,91 +128,87 @@ class ReceiverBridge:
     def validate_payload(self, payload: Dict[str, Any]) -> tuple[bool, str]:
         """Validate received payload integrity and signature"""
         try:
+            # Validate required sections and fields in one compiled pass; this is far cheaper
+            # than the signature check, so malformed payloads are rejected before any crypto
+            try:
+                delivery = DeliveryPayload.model_validate(payload)
+            except ValidationError as e:
+                error = e.errors()[0]
+                field = '.'.join(str(part) for part in error['loc'])
+                return False, f"Invalid or missing field {field}: {error['msg']}"
+            
             # Validate security
             is_valid, message = self.security_manager.validate_secure_payload(payload)
             if not is_valid:
                 return False, f"Security validation failed: {message}"
             
-            # Validate required fields
-            required_sections = ['transaction', 'packing_slip', 'bill_of_lading', 'erp_identifiers']
-            for section in required_sections:
-                if section not in payload:
-                    return False, f"Missing required section: {section}"
-            
-            # Validate transaction data
-            transaction = payload.get('transaction', {})
-            if not transaction.get('transaction_id'):
-                return False, "Missing transaction ID"
-            
-            # Validate ERP identifiers
-            erp_ids = payload.get('erp_identifiers', {})
-            if not erp_ids.get('receiver_erp_id'):
-                return False, "Missing receiver ERP ID"
-            
-            logger.info(f"Payload validation successful for transaction {transaction.get('transaction_id')}")
+            logger.info(f"Payload validation successful for transaction {delivery.transaction.transaction_id}")
             return True, "Payload validation successful"
             
         except Exception as e:
             logger.error(f"Payload validation error: {e}")
             return False, f"Validation error: {str(e)}"
     
-    def process_shipment_completion(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+    async def process_shipment_completion(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """Process shipment completion and update ERP systems"""
         try:
             transaction_id = payload['transaction']['transaction_id']
             bol_number = payload['bill_of_lading']['bol_number']
+            erp = self.erp_integration
             
             logger.info(f"Processing shipment completion for BOL: {bol_number}")
             
-            # Update shipment status in SAP
-            if self.erp_integration:
-                success = self.erp_integration.update_shipment_status(bol_number, 'delivered')
-                if not success:
-                    raise Exception("Failed to update shipment status in SAP")
-            
-            # Update inventory in SAP
-            packing_slip = payload.get('packing_slip', {})
-            items = packing_slip.get('items', [])
-            
-            for item in items:
-                success = self.erp_integration.update_inventory(
-                    item['item_id'],
-                    item['quantity'],
-                    'add'  # Add to receiver inventory
-                )
-                if not success:
-                    logger.warning(f"Failed to update inventory for item {item['item_id']}")
-            
-            # Release payment if commercial invoice exists
-            commercial_invoice = payload.get('commercial_invoice', {})
-            if commercial_invoice.get('invoice_number') and commercial_invoice.get('total_value'):
-                payment_success = self.erp_integration.release_payment(
-                    commercial_invoice['invoice_number'],
-                    commercial_invoice['total_value']
-                )
-                if payment_success:
-                    logger.info(f"Payment released for invoice {commercial_invoice['invoice_number']}")
-                else:
-                    logger.warning(f"Failed to release payment for invoice {commercial_invoice['invoice_number']}")
-            
-            # Create completion response
+            # Queue here rather than opening more SAP sessions than the ERP can take
+            async with self.erp_slots:
+                # ERP calls block; run them in the executor so other clients keep being served
+                # Update shipment status in SAP
+                if erp:
+                    success = await erp.run_async(erp.update_shipment_status, bol_number, 'delivered')
+                    if not success:
+                        raise Exception("Failed to update shipment status in SAP")
+                
+                # Update inventory in SAP, all items in one bulk request
+                packing_slip = payload.get('packing_slip', {})
+                items = packing_slip.get('items', [])
+                
+                if items:
+                    results = await erp.run_async(erp.bulk_update_inventory, [
+                        {
+                            'item_id': item['item_id'],
+                            'quantity': item['quantity'],
+                            'operation': 'add'  # Add to receiver inventory
+                        }
+                        for item in items
+                    ])
+                    for item_id, success in results.items():
+                        if not success:
+                            logger.warning(f"Failed to update inventory for item {item_id}")
+                
+                # Release payment if commercial invoice exists
+                commercial_invoice = payload.get('commercial_invoice', {})
+                if commercial_invoice.get('invoice_number') and commercial_invoice.get('total_value'):
+                    payment_success = await erp.run_async(
+                        erp.release_payment,
+                        commercial_invoice['invoice_number'],
+                        commercial_invoice['total_value']
+                    )
+                    if payment_success:
+                        logger.info(f"Payment released for invoice {commercial_invoice['invoice_number']}")
+                    else:
+                        logger.warning(f"Failed to release payment for invoice {commercial_invoice['invoice_number']}")
+                
+            # Create completion response; one clock reading stamps every field
+            now = utc_now_iso()
             completion_response = {
                 'transaction': {
                     'transaction_id': transaction_id,
                     'status': 'completed',
-                    'timestamp': datetime.now().isoformat() + 'Z',
-                    'location': {
-                        'latitude': 39.9612,  # Columbus, OH coordinates
-                        'longitude': -82.9988,
-                        'address': '456 Distribution Center Blvd',
-                        'city': 'Columbus',
-                        'state': 'OH',
-                        'zip_code': '43215'
-                    }
+                    'timestamp': now,
+                    'location': RECEIVER_LOCATION
                 },
                 'shipment_details': {
                     'bol_number': bol_number,
-                    'delivery_timestamp': datetime.now().isoformat() + 'Z',
+                    'delivery_timestamp': now,
                     'items_received': len(items),
                     'total_weight_received': packing_slip.get('total_weight', 0.0),
                     'pallet_count_received': packing_slip.get('pallet_count', 0)
@@ -158,15 +217,11 @@ class ReceiverBridge:
                     'receiver_erp_id': payload['erp_identifiers']['receiver_erp_id'],
                     'receiver_erp_type': payload['erp_identifiers']['receiver_erp_type']
                 },
-                'metadata': {
-                    'version': '1.0',
-                    'processed_by': 'receiver_bridge',
-                    'processing_timestamp': datetime.now().isoformat() + 'Z'
-                }
+                'metadata': {**COMPLETION_METADATA, 'processing_timestamp': now}
             }
             
-            # Add security to completion response
-            secure_completion = self.security_manager.create_secure_payload(completion_response)
+            # Add security to completion response; signing runs on the crypto pool
+            secure_completion = await self.security_manager.async_create_secure_payload(completion_response, now)
             
             logger.info(f"Shipment completion processed successfully for BOL: {bol_number}")
             return secure_completion
@@ -175,48 +230,48 @@ class ReceiverBridge:
             logger.error(f"Failed to process shipment completion: {e}")
             raise
     
-    async def handle_client(self, client_socket: socket.socket, address: tuple):
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         """Handle individual client connections"""
+        address = writer.get_extra_info('peername')
         try:
             logger.info(f"Client connected from {address}")
-            self.active_connections.append(client_socket)
+            self.client_tasks.add(asyncio.current_task())
+            
+            # Replies are small; don't let Nagle hold them back
+            client_socket = writer.get_extra_info('socket')
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
             
-            while self.running:
-                # Receive data from client
-                data = await asyncio.get_event_loop().run_in_executor(
-                    None, client_socket.recv, 4096
-                )
+            # Runs until the client disconnects or stop_server cancels this handler
+            while True:
+                # Receive one framed request from client
+                data = await read_frame(reader)
                 
-                if not data:
+                if data is None:
                     break
                 
                 # Parse received data
                 try:
-                    request = json.loads(data.decode('utf-8'))
+                    request = orjson.loads(data)
                     response = await self.process_request(request)
                     
                     # Send response back to client
-                    await asyncio.get_event_loop().run_in_executor(
-                        None, client_socket.send, json.dumps(response).encode('utf-8')
-                    )
+                    write_frame(writer, orjson.dumps(response))
+                    await writer.drain()
                     
-                except json.JSONDecodeError as e:
+                except orjson.JSONDecodeError as e:
                     logger.error(f"Invalid JSON received: {e}")
-                    error_response = {
-                        'status': 'error',
-                        'message': 'Invalid JSON format',
-                        'timestamp': datetime.now().isoformat() + 'Z'
-                    }
-                    await asyncio.get_event_loop().run_in_executor(
-                        None, client_socket.send, json.dumps(error_response).encode('utf-8')
-                    )
+                    write_frame(writer, INVALID_JSON_RESPONSE)
+                    await writer.drain()
                     
+        except asyncio.CancelledError:
+            # Server shutdown; end normally so asyncio doesn't report the handler as failed
+            pass
         except Exception as e:
             logger.error(f"Error handling client {address}: {e}")
         finally:
-            if client_socket in self.active_connections:
-                self.active_connections.remove(client_socket)
-            client_socket.close()
+            self.client_tasks.discard(asyncio.current_task())
+            writer.close()
             logger.info(f"Client {address} disconnected")
     
     async def process_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
@@ -234,7 +289,7 @@ class ReceiverBridge:
                 return {
                     'status': 'error',
                     'message': f'Unknown request type: {request_type}',
-                    'timestamp': datetime.now().isoformat() + 'Z'
+                    'timestamp': utc_now_iso()
                 }
                 
         except Exception as e:
@@ -242,7 +297,7 @@ class ReceiverBridge:
             return {
                 'status': 'error',
                 'message': str(e),
-                'timestamp': datetime.now().isoformat() + 'Z'
+                'timestamp': utc_now_iso()
             }
     
     async def _handle_deliver_shipment(self, request: Dict[str, Any]) -> Dict[str, Any]:
@@ -256,25 +311,29 @@ class ReceiverBridge:
                 return {
                     'status': 'error',
                     'message': f'Payload validation failed: {message}',
-                    'timestamp': datetime.now().isoformat() + 'Z'
+                    'timestamp': utc_now_iso()
                 }
             
             # Process shipment completion
-            completion_response = self.process_shipment_completion(payload)
+            completion_response = await self.process_shipment_completion(payload)
             
             # Store completion for tracking
+            now = utc_now_iso()
             transaction_id = payload['transaction']['transaction_id']
             self.pending_shipments[transaction_id] = {
                 'status': 'completed',
-                'completion_time': datetime.now().isoformat() + 'Z',
+                'completion_time': now,
                 'bol_number': payload['bill_of_lading']['bol_number']
             }
+            self.pending_shipments.move_to_end(transaction_id)
+            if len(self.pending_shipments) > MAX_TRACKED_SHIPMENTS:
+                self.pending_shipments.popitem(last=False)
             
             return {
                 'status': 'success',
                 'message': 'Shipment delivered and processed successfully',
                 'completion_data': completion_response,
-                'timestamp': datetime.now().isoformat() + 'Z'
+                'timestamp': now
             }
             
         except Exception as e:
@@ -282,7 +341,7 @@ class ReceiverBridge:
             return {
                 'status': 'error',
                 'message': f'Failed to process shipment delivery: {str(e)}',
-                'timestamp': datetime.now().isoformat() + 'Z'
+                'timestamp': utc_now_iso()
             }
     
     async def _handle_validate_payload(self, request: Dict[str, Any]) -> Dict[str, Any]:
@@ -297,7 +356,7 @@ class ReceiverBridge:
                 'status': 'success' if is_valid else 'error',
                 'message': message,
                 'valid': is_valid,
-                'timestamp': datetime.now().isoformat() + 'Z'
+                'timestamp': utc_now_iso()
             }
             
         except Exception as e:
@@ -305,7 +364,7 @@ class ReceiverBridge:
             return {
                 'status': 'error',
                 'message': f'Failed to validate payload: {str(e)}',
-                'timestamp': datetime.now().isoformat() + 'Z'
+                'timestamp': utc_now_iso()
             }
     
     async def _handle_get_completion_status(self, request: Dict[str, Any]) -> Dict[str, Any]:
@@ -317,25 +376,25 @@ class ReceiverBridge:
                 return {
                     'status': 'error',
                     'message': 'Transaction ID is required',
-                    'timestamp': datetime.now().isoformat() + 'Z'
+                    'timestamp': utc_now_iso()
                 }
             
             # Check if transaction exists in pending shipments
-            if transaction_id in self.pending_shipments:
-                shipment_info = self.pending_shipments[transaction_id]
+            shipment_info = self.pending_shipments.get(transaction_id)
+            if shipment_info is not None:
                 return {
                     'status': 'success',
                     'transaction_id': transaction_id,
                     'shipment_status': shipment_info['status'],
                     'completion_time': shipment_info['completion_time'],
                     'bol_number': shipment_info['bol_number'],
-                    'timestamp': datetime.now().isoformat() + 'Z'
+                    'timestamp': utc_now_iso()
                 }
             else:
                 return {
                     'status': 'error',
                     'message': f'Transaction {transaction_id} not found',
-                    'timestamp': datetime.now().isoformat() + 'Z'
+                    'timestamp': utc_now_iso()
                 }
                 
         except Exception as e:
@@ -343,58 +402,44 @@ class ReceiverBridge:
             return {
                 'status': 'error',
                 'message': f'Failed to get completion status: {str(e)}',
-                'timestamp': datetime.now().isoformat() + 'Z'
+                'timestamp': utc_now_iso()
             }
     
     async def start_server(self):
         """Start the receiver bridge server"""
         try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
-            self.server_socket.setblocking(False)
+            self.server = await asyncio.start_server(
+                self.handle_client, self.host, self.port, backlog=512, reuse_address=True
+            )
             
-            self.running = True
             logger.info(f"Receiver bridge server started on {self.host}:{self.port}")
             
-            while self.running:
-                try:
-                    client_socket, address = await asyncio.get_event_loop().run_in_executor(
-                        None, self.server_socket.accept
-                    )
-                    
-                    # Handle client in separate task
-                    asyncio.create_task(self.handle_client(client_socket, address))
-                    
-                except BlockingIOError:
-                    await asyncio.sleep(0.1)
-                except Exception as e:
-                    logger.error(f"Error accepting connection: {e}")
+            async with self.server:
+                await self.server.serve_forever()
                     
         except Exception as e:
             logger.error(f"Failed to start server: {e}")
         finally:
-            self.stop_server()
+            await self.stop_server()
     
-    def stop_server(self):
-        """Stop the receiver bridge server"""
-        self.running = False
+    async def stop_server(self):
+        """Stop the receiver bridge server and wait for client handlers to finish"""
+        # Stop accepting connections
+        if self.server:
+            self.server.close()
         
-        # Close all client connections
-        for client_socket in self.active_connections:
-            try:
-                client_socket.close()
-            except:
-                pass
-        self.active_connections.clear()
+        # Cancel client handlers; each closes its own connection while unwinding
+        tasks = list(self.client_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
         
-        # Close server socket
-        if self.server_socket:
-            try:
-                self.server_socket.close()
-            except:
-                pass
+        if self.server:
+            await self.server.wait_closed()
+        
+        # Release the ERP connection pool once no handler can use it
+        if self.erp_integration:
+            self.erp_integration.close()
         
         logger.info("Receiver bridge server stopped")
 
@@ -407,7 +452,10 @@ async def main():
     except KeyboardInterrupt:
         logger.info("Received interrupt signal, shutting down...")
     finally:
-        receiver_bridge.stop_server()
+        await receiver_bridge.stop_server()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
\ No newline at end of file
@@ -4,19 +4,26 @@ Handles shipment initiation and ERP integration with Infor SyteLine
 """
 
 import asyncio
-import json
 import logging
 import socket
 import sys
 import os
-from datetime import datetime
 from typing import Dict, Any, Optional
 import threading
 import time
 
+import orjson
+
+try:
+    import uvloop
+except ImportError:  # not available on Windows
+    uvloop = None
+
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from common.clock import utc_now_iso
+from common.framing import read_frame, write_frame
 from common.security import SecurityManager
 from common.erp_integration import ERPIntegrationFactory, MOCK_ERP_CONFIGS, ERPConfig
 
@@ -31,6 +38,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Fixed part of every shipment payload, shared rather than rebuilt per shipment
+SHIPPER_LOCATION = {
+    'latitude': 40.1264,  # Westerville, OH coordinates
+    'longitude': -82.9291,
+    'address': '123 Logistics Way',
+    'city': 'Westerville',
+    'state': 'OH',
+    'zip_code': '43081'
+}
+
 class ShipperBackend:
     """Shipper backend server for NFC logistics system"""
     
@@ -39,7 +56,7 @@ class ShipperBackend:
         self.port = port
         self.security_manager = SecurityManager()
         self.erp_integration = None
-        self.server_socket = None
+        self.server = None
         self.running = False
         self.active_connections = []
         
@@ -61,28 +78,25 @@ class ShipperBackend:
         except Exception as e:
             logger.error(f"Failed to initialize ERP integration: {e}")
     
-    def generate_shipment_payload(self, shipment_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Generate complete shipment payload from ERP data"""
+    async def generate_shipment_payload(self, shipment_data: Dict[str, Any], now: Optional[str] = None) -> Dict[str, Any]:
+        """Generate complete shipment payload from ERP data, stamped with now (default: the current time)"""
         try:
+            items = shipment_data.get('items', [])
+            if now is None:
+                now = utc_now_iso()
+            
             # Create base payload structure
             payload = {
                 'transaction': {
                     'transaction_id': self.security_manager.generate_transaction_id('SHP'),
                     'status': 'initiated',
-                    'timestamp': datetime.now().isoformat() + 'Z',
-                    'location': {
-                        'latitude': 40.1264,  # Westerville, OH coordinates
-                        'longitude': -82.9291,
-                        'address': '123 Logistics Way',
-                        'city': 'Westerville',
-                        'state': 'OH',
-                        'zip_code': '43081'
-                    }
+                    'timestamp': now,
+                    'location': SHIPPER_LOCATION
                 },
                 'packing_slip': {
-                    'items': shipment_data.get('items', []),
+                    'items': items,
                     'total_weight': shipment_data.get('total_weight', 0.0),
-                    'total_items': sum(item.get('quantity', 0) for item in shipment_data.get('items', [])),
+                    'total_items': sum(item.get('quantity', 0) for item in items),
                     'pallet_count': shipment_data.get('pallet_count', 1)
                 },
                 'bill_of_lading': {
@@ -92,7 +106,7 @@ class ShipperBackend:
                     'transit_type': shipment_data.get('transit_type', 'truck'),
                     'origin': shipment_data.get('origin', 'Westerville, OH'),
                     'destination': shipment_data.get('destination', ''),
-                    'pickup_date': shipment_data.get('pickup_date', datetime.now().isoformat() + 'Z'),
+                    'pickup_date': shipment_data.get('pickup_date', now),
                     'delivery_date': shipment_data.get('delivery_date', '')
                 },
                 'batch_details': {
@@ -120,14 +134,14 @@ class ShipperBackend:
                 'metadata': {
                     'version': '1.0',
                     'created_by': 'shipper_system',
-                    'last_modified': datetime.now().isoformat() + 'Z',
+                    'last_modified': now,
                     'priority': shipment_data.get('priority', 'normal'),
                     'special_instructions': shipment_data.get('special_instructions', '')
                 }
             }
             
-            # Create secure payload with digital signature
-            secure_payload = self.security_manager.create_secure_payload(payload)
+            # Create secure payload with digital signature; signing runs on the crypto pool
+            secure_payload = await self.security_manager.async_create_secure_payload(payload, now)
             
             logger.info(f"Generated secure payload for transaction {secure_payload['transaction']['transaction_id']}")
             return secure_payload
@@ -145,13 +159,20 @@ class ShipperBackend:
             # Create shipment in ERP
             shipment_id = self.erp_integration.create_shipment(shipment_data)
             
-            # Update inventory levels
-            for item in shipment_data.get('items', []):
-                self.erp_integration.update_inventory(
-                    item['item_id'],
-                    item['quantity'],
-                    'subtract'  # Remove from shipper inventory
-                )
+            # Update inventory levels in one request rather than one per item
+            items = shipment_data.get('items', [])
+            if items:
+                results = self.erp_integration.bulk_update_inventory([
+                    {
+                        'item_id': item['item_id'],
+                        'quantity': item['quantity'],
+                        'operation': 'subtract'  # Remove from shipper inventory
+                    }
+                    for item in items
+                ])
+                for item_id, success in results.items():
+                    if not success:
+                        logger.warning(f"Failed to update inventory for item {item_id}")
             
             logger.info(f"Created shipment {shipment_id} in Infor SyteLine ERP")
             return shipment_id
@@ -160,48 +181,50 @@ class ShipperBackend:
             logger.error(f"Failed to create shipment in ERP: {e}")
             raise
     
-    async def handle_client(self, client_socket: socket.socket, address: tuple):
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         """Handle individual client connections"""
+        address = writer.get_extra_info('peername')
         try:
             logger.info(f"Client connected from {address}")
-            self.active_connections.append(client_socket)
+            self.active_connections.append(writer)
+            
+            # Replies are small; don't let Nagle hold them back
+            client_socket = writer.get_extra_info('socket')
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
             
             while self.running:
-                # Receive data from client
-                data = await asyncio.get_event_loop().run_in_executor(
-                    None, client_socket.recv, 4096
-                )
+                # Receive one framed request from client
+                data = await read_frame(reader)
                 
-                if not data:
+                if data is None:
                     break
                 
                 # Parse received data
                 try:
-                    request = json.loads(data.decode('utf-8'))
+                    request = orjson.loads(data)
                     response = await self.process_request(request)
                     
                     # Send response back to client
-                    await asyncio.get_event_loop().run_in_executor(
-                        None, client_socket.send, json.dumps(response).encode('utf-8')
-                    )
+                    write_frame(writer, orjson.dumps(response))
+                    await writer.drain()
                     
-                except json.JSONDecodeError as e:
+                except orjson.JSONDecodeError as e:
                     logger.error(f"Invalid JSON received: {e}")
                     error_response = {
                         'status': 'error',
                         'message': 'Invalid JSON format',
-                        'timestamp': datetime.now().isoformat() + 'Z'
+                        'timestamp': utc_now_iso()
                     }
-                    await asyncio.get_event_loop().run_in_executor(
-                        None, client_socket.send, json.dumps(error_response).encode('utf-8')
-                    )
+                    write_frame(writer, orjson.dumps(error_response))
+                    await writer.drain()
                     
         except Exception as e:
             logger.error(f"Error handling client {address}: {e}")
         finally:
-            if client_socket in self.active_connections:
-                self.active_connections.remove(client_socket)
-            client_socket.close()
+            if writer in self.active_connections:
+                self.active_connections.remove(writer)
+            writer.close()
             logger.info(f"Client {address} disconnected")
     
     async def process_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
@@ -219,7 +242,7 @@ class ShipperBackend:
                 return {
                     'status': 'error',
                     'message': f'Unknown request type: {request_type}',
-                    'timestamp': datetime.now().isoformat() + 'Z'
+                    'timestamp': utc_now_iso()
                 }
                 
         except Exception as e:
@@ -227,7 +250,7 @@ class ShipperBackend:
             return {
                 'status': 'error',
                 'message': str(e),
-                'timestamp': datetime.now().isoformat() + 'Z'
+                'timestamp': utc_now_iso()
             }
     
     async def _handle_create_shipment(self, request: Dict[str, Any]) -> Dict[str, Any]:
@@ -235,11 +258,17 @@ class ShipperBackend:
         try:
             shipment_data = request.get('shipment_data', {})
             
-            # Create shipment in ERP
-            shipment_id = self.create_shipment_in_erp(shipment_data)
+            if not self.erp_integration:
+                raise Exception("ERP integration not initialized")
+            
+            # Create shipment in ERP; the blocking calls run on the ERP executor
+            shipment_id = await self.erp_integration.run_async(self.create_shipment_in_erp, shipment_data)
+            
+            # One timestamp for the payload and the response
+            now = utc_now_iso()
             
             # Generate secure payload
-            payload = self.generate_shipment_payload(shipment_data)
+            payload = await self.generate_shipment_payload(shipment_data, now)
             
             # Update shipment ID in payload
             payload['bill_of_lading']['bol_number'] = shipment_id
@@ -249,7 +278,7 @@ class ShipperBackend:
                 'message': 'Shipment created successfully',
                 'shipment_id': shipment_id,
                 'payload': payload,
-                'timestamp': datetime.now().isoformat() + 'Z'
+                'timestamp': now
             }
             
         except Exception as e:
@@ -257,7 +286,7 @@ class ShipperBackend:
             return {
                 'status': 'error',
                 'message': f'Failed to create shipment: {str(e)}',
-                'timestamp': datetime.now().isoformat() + 'Z'
+                'timestamp': utc_now_iso()
             }
     
     async def _handle_get_shipment_status(self, request: Dict[str, Any]) -> Dict[str, Any]:
@@ -269,7 +298,7 @@ class ShipperBackend:
                 return {
                     'status': 'error',
                     'message': 'Shipment ID is required',
-                    'timestamp': datetime.now().isoformat() + 'Z'
+                    'timestamp': utc_now_iso()
                 }
             
             # Get status from ERP (mock implementation)
@@ -279,7 +308,7 @@ class ShipperBackend:
                 'status': 'success',
                 'shipment_id': shipment_id,
                 'shipment_status': status,
-                'timestamp': datetime.now().isoformat() + 'Z'
+                'timestamp': utc_now_iso()
             }
             
         except Exception as e:
@@ -287,7 +316,7 @@ class ShipperBackend:
             return {
                 'status': 'error',
                 'message': f'Failed to get shipment status: {str(e)}',
-                'timestamp': datetime.now().isoformat() + 'Z'
+                'timestamp': utc_now_iso()
             }
     
     async def _handle_update_shipment(self, request: Dict[str, Any]) -> Dict[str, Any]:
@@ -300,30 +329,32 @@ class ShipperBackend:
                 return {
                     'status': 'error',
                     'message': 'Shipment ID and status are required',
-                    'timestamp': datetime.now().isoformat() + 'Z'
+                    'timestamp': utc_now_iso()
                 }
             
             # Update status in ERP
             if self.erp_integration:
-                success = self.erp_integration.update_shipment_status(shipment_id, new_status)
+                success = await self.erp_integration.run_async(
+                    self.erp_integration.update_shipment_status, shipment_id, new_status
+                )
                 
                 if success:
                     return {
                         'status': 'success',
                         'message': f'Shipment {shipment_id} status updated to {new_status}',
-                        'timestamp': datetime.now().isoformat() + 'Z'
+                        'timestamp': utc_now_iso()
                     }
                 else:
                     return {
                         'status': 'error',
                         'message': f'Failed to update shipment status in ERP',
-                        'timestamp': datetime.now().isoformat() + 'Z'
+                        'timestamp': utc_now_iso()
                     }
             else:
                 return {
                     'status': 'error',
                     'message': 'ERP integration not available',
-                    'timestamp': datetime.now().isoformat() + 'Z'
+                    'timestamp': utc_now_iso()
                 }
                 
         except Exception as e:
@@ -331,34 +362,21 @@ class ShipperBackend:
             return {
                 'status': 'error',
                 'message': f'Failed to update shipment: {str(e)}',
-                'timestamp': datetime.now().isoformat() + 'Z'
+                'timestamp': utc_now_iso()
             }
     
     async def start_server(self):
         """Start the shipper server"""
         try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
-            self.server_socket.setblocking(False)
+            self.server = await asyncio.start_server(
+                self.handle_client, self.host, self.port, backlog=512, reuse_address=True
+            )
             
             self.running = True
             logger.info(f"Shipper server started on {self.host}:{self.port}")
             
-            while self.running:
-                try:
-                    client_socket, address = await asyncio.get_event_loop().run_in_executor(
-                        None, self.server_socket.accept
-                    )
-                    
-                    # Handle client in separate task
-                    asyncio.create_task(self.handle_client(client_socket, address))
-                    
-                except BlockingIOError:
-                    await asyncio.sleep(0.1)
-                except Exception as e:
-                    logger.error(f"Error accepting connection: {e}")
+            async with self.server:
+                await self.server.serve_forever()
                     
         except Exception as e:
             logger.error(f"Failed to start server: {e}")
@@ -370,19 +388,20 @@ class ShipperBackend:
         self.running = False
         
         # Close all client connections
-        for client_socket in self.active_connections:
+        for writer in self.active_connections:
             try:
-                client_socket.close()
+                writer.close()
             except:
                 pass
         self.active_connections.clear()
         
-        # Close server socket
-        if self.server_socket:
-            try:
-                self.server_socket.close()
-            except:
-                pass
+        # Close server
+        if self.server:
+            self.server.close()
+        
+        # Release the ERP connection pool
+        if self.erp_integration:
+            self.erp_integration.close()
         
         logger.info("Shipper server stopped")
 
@@ -398,4 +417,7 @@ async def main():
         shipper.stop_server()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
\ No newline at end of file
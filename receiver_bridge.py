@@ -5,21 +5,31 @@ Blue Ships Sync - Bridge and Receiver service
 Acts as intermediary between shipper, carrier (Android app), and receiver ERP.
 """
 
+import asyncio
 import socket
-import socketserver
+import struct
 import threading
+import time
 from threading import Thread
-import json
 import os
 import logging
-import base64
+import queue
+from abc import ABC, abstractmethod
+import hashlib
+from collections import OrderedDict
 from datetime import datetime, timezone
-from typing import Dict, Any
-
+from typing import Dict, Any, List, Optional, Tuple
+
+import orjson
+try:
+    # SIMD base64; the stdlib module is a drop-in fallback
+    import pybase64 as base64
+except ImportError:
+    import base64
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding
 
-from flask import Flask, jsonify, request, abort
+from flask import Flask, Response, request, abort
 
 BRIDGE_PORT_INIT = 65432
 BRIDGE_PORT_COMPLETE = 65433
@@ -27,14 +37,127 @@ KEY_DIR = os.getenv("KEY_DIR", "./keys")
 SHIPPER_PUBLIC_KEY_FILE = os.path.join(KEY_DIR, "shipper_public.pem")
 APP_HOST = "0.0.0.0"
 APP_PORT = 5000
+NOTIFY_QUEUE_SIZE = 1024
+VERIFY_CACHE_SIZE = 1024
+PAYLOAD_STORE_SIZE = 100_000
+PAYLOAD_TTL = 24 * 60 * 60  # seconds
+LISTEN_BACKLOG = 512
+IDLE_TIMEOUT = 60  # seconds
 
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] bridge - %(message)s",
 )
 
+
+class PayloadStore:
+    """Bounded in-memory payload store with least-recently-used eviction.
+
+    Each entry keeps the parsed payload together with its serialized form,
+    which the REST API serves as-is. Both change under one lock so they can
+    never drift apart. Entries expire ttl seconds after they were last put.
+    """
+
+    def __init__(self, maxsize: int = PAYLOAD_STORE_SIZE, ttl: float = PAYLOAD_TTL):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], bytes, float]]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def put(self, tx_id: str, payload: Dict[str, Any], encoded: bytes):
+        expires_at = time.monotonic() + self._ttl
+        with self._lock:
+            self._entries[tx_id] = (payload, encoded, expires_at)
+            self._entries.move_to_end(tx_id)
+            while len(self._entries) > self._maxsize:
+                evicted, _ = self._entries.popitem(last=False)
+                logging.warning("Payload store full; evicted %s", evicted)
+
+    def _get(self, tx_id: str) -> Optional[Tuple[Dict[str, Any], bytes, float]]:
+        with self._lock:
+            entry = self._entries.get(tx_id)
+            if entry is None:
+                return None
+            if entry[2] <= time.monotonic():
+                del self._entries[tx_id]
+                return None
+            self._entries.move_to_end(tx_id)
+            return entry
+
+    def get(self, tx_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._get(tx_id)
+        return entry[0] if entry is not None else None
+
+    def get_encoded(self, tx_id: str) -> Optional[bytes]:
+        entry = self._get(tx_id)
+        return entry[1] if entry is not None else None
+
+    def keys(self) -> List[str]:
+        now = time.monotonic()
+        with self._lock:
+            expired = [tx_id for tx_id, entry in self._entries.items() if entry[2] <= now]
+            for tx_id in expired:
+                del self._entries[tx_id]
+            return list(self._entries)
+
+
 # In-memory storage; replace with persistent store in production
-PAYLOAD_STORE: Dict[str, Dict[str, Any]] = {}
+PAYLOAD_STORE = PayloadStore()
+
+# Every socket message is a 4-byte big-endian length followed by the body
+FRAME_HEADER = struct.Struct(">I")
+# Largest body a peer may announce; anything bigger is refused before allocating for it
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+# sendmsg is missing on Windows
+HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+# Signature scheme shared with the shipper; built once and reused for every verify
+SIGNATURE_PADDING = padding.PKCS1v15()
+SIGNATURE_HASH = hashes.SHA256()
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """Read one frame body.
+
+    Returns None if the peer closes the connection between frames; a close
+    part-way through, or an oversized frame, raises ConnectionError.
+    """
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError as exc:
+        if not exc.partial:
+            return None
+        raise ConnectionError("Connection closed mid-frame") from exc
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ConnectionError(f"Frame of {size} bytes exceeds the {MAX_FRAME_SIZE} byte limit")
+    try:
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError as exc:
+        raise ConnectionError("Connection closed mid-frame") from exc
+
+
+def encode_frame(body: bytes) -> bytes:
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+def send_frame(sock: socket.socket, body: bytes) -> None:
+    header = FRAME_HEADER.pack(len(body))
+    if not HAS_SENDMSG:
+        sock.sendall(header + body)
+        return
+    # Gather-write header and body in one syscall without copying the body
+    sent = sock.sendmsg([header, body])
+    if sent < len(header):
+        sock.sendall(header[sent:])
+        sock.sendall(body)
+    elif sent < len(header) + len(body):
+        sock.sendall(memoryview(body)[sent - len(header):])
+
+
+# Replies to the shipper never change, so frame them once
+ACK_FRAME = encode_frame(b"ACK")
+INVALID_SIGNATURE_FRAME = encode_frame(b"INVALID_SIGNATURE")
+ERROR_FRAME = encode_frame(b"ERROR")
 
 
 def load_shipper_public_key():
@@ -47,87 +170,213 @@ def load_shipper_public_key():
 SHIPPER_PUBLIC_KEY = load_shipper_public_key()
 
 
-def verify_signature(public_key, payload: Dict[str, Any]) -> bool:
-    sig_b64 = payload.pop("digital_signature", None)
-    if not sig_b64:
-        return False
-    try:
-        signature = base64.b64decode(sig_b64)
-    except Exception:
-        return False
-    message = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+# (signature, SHA-256 of message) pairs that verified; keyed on a digest so frame bodies are never pinned
+_VERIFIED_SIGNATURES: "OrderedDict[Tuple[bytes, bytes], None]" = OrderedDict()
+_VERIFIED_LOCK = threading.Lock()
+
+
+def _verify_shipper_signature(signature: bytes, message: bytes) -> bool:
+    # Shippers resend payloads whose ACK they missed; identical bytes need only one RSA verify.
+    # Failures are not remembered, so unauthenticated peers cannot fill the cache.
+    key = (signature, hashlib.sha256(message).digest())
+    with _VERIFIED_LOCK:
+        if key in _VERIFIED_SIGNATURES:
+            _VERIFIED_SIGNATURES.move_to_end(key)
+            return True
     try:
-        public_key.verify(
+        SHIPPER_PUBLIC_KEY.verify(
             signature,
             message,
-            padding.PKCS1v15(),
-            hashes.SHA256()
+            SIGNATURE_PADDING,
+            SIGNATURE_HASH
         )
-        return True
     except Exception as exc:
         logging.error("Signature verification failed: %s", exc)
         return False
+    with _VERIFIED_LOCK:
+        _VERIFIED_SIGNATURES[key] = None
+        while len(_VERIFIED_SIGNATURES) > VERIFY_CACHE_SIZE:
+            _VERIFIED_SIGNATURES.popitem(last=False)
+    return True
+
+
+# shipper.py appends the signature as the last field of the exact bytes it signed
+SIGNATURE_FIELD = b',"digital_signature":"'
+
+
+def verify_frame(data: bytes, payload: Dict[str, Any]) -> bool:
+    """Verify a payload frame against the signed bytes it carries, without re-encoding it."""
+    cut = data.rfind(SIGNATURE_FIELD)
+    sig_b64 = payload.get("digital_signature")
+    if cut == -1 or not isinstance(sig_b64, str) or data[cut + len(SIGNATURE_FIELD):] != sig_b64.encode() + b'"}':
+        # Not laid out the way shipper.py sends it; fall back to re-encoding the payload
+        return verify_signature(payload)
+    try:
+        signature = base64.b64decode(sig_b64)
+    except Exception:
+        return False
+    return _verify_shipper_signature(signature, data[:cut] + b"}")
+
+
+def verify_signature(payload: Dict[str, Any]) -> bool:
+    sig_b64 = payload.pop("digital_signature", None)
+    if not sig_b64:
+        return False
+    try:
+        signature = base64.b64decode(sig_b64)
+        return _verify_shipper_signature(signature, orjson.dumps(payload))
+    except Exception:
+        return False
     finally:
         # restore signature for persistence
         payload["digital_signature"] = sig_b64
 
 
-class ShipperInitHandler(socketserver.BaseRequestHandler):
-    def handle(self):
-        data = b""
-        while not data.endswith(b"\n"):
-            packet = self.request.recv(4096)
-            if not packet:
-                break
-            data += packet
+class FramedConnectionHandler(ABC):
+    """Serves one framed connection per call on the socket server loop.
+
+    Connections are kept open so a peer can send several frames; idle ones
+    are closed after IDLE_TIMEOUT. ``handle_frame`` returns the encoded
+    reply frame to send back, if any.
+    """
+
+    async def __call__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info("peername")[0]
+        # Replies are a few bytes; don't let Nagle hold them back
+        sock = writer.get_extra_info("socket")
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(read_frame(reader), IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    logging.info("Closing idle connection from %s", peer)
+                    break
+                if data is None:
+                    break
+                reply = self.handle_frame(data)
+                if reply is not None:
+                    writer.write(reply)
+                    await writer.drain()
+        except ConnectionError as exc:
+            logging.warning("Dropping connection from %s: %s", peer, exc)
+        except asyncio.CancelledError:
+            # Server shutdown; close quietly
+            pass
+        finally:
+            writer.close()
+
+    @abstractmethod
+    def handle_frame(self, data: bytes) -> Optional[bytes]:
+        """Handle one frame body and return the encoded reply frame, if any."""
+        pass
+
+
+class ShipperInitHandler(FramedConnectionHandler):
+    def handle_frame(self, data: bytes) -> Optional[bytes]:
         try:
-            payload = json.loads(data.decode("utf-8").strip())
-            if not verify_signature(SHIPPER_PUBLIC_KEY, payload):
-                self.request.sendall(b"INVALID_SIGNATURE\n")
+            payload = orjson.loads(data)
+            if not verify_frame(data, payload):
                 logging.warning("Rejected payload due to invalid signature.")
-                return
+                return INVALID_SIGNATURE_FRAME
             tx_id = payload["transaction_id"]
-            PAYLOAD_STORE[tx_id] = payload
+            PAYLOAD_STORE.put(tx_id, payload, data)
             logging.info("Stored payload %s", tx_id)
-            self.request.sendall(b"ACK\n")
+            return ACK_FRAME
         except Exception as e:
             logging.error("Error processing payload: %s", e)
-            self.request.sendall(b"ERROR\n")
+            return ERROR_FRAME
+
+
+class ShipperCompleteHandler(FramedConnectionHandler):
+    def handle_frame(self, data: bytes) -> Optional[bytes]:
+        logging.info("Received completion acknowledgment from receiver: %s", data.decode("utf-8", "replace"))
+        return None
+
+
+class SocketServerLoop:
+    """One asyncio loop, on a daemon thread, serving every framed socket server.
 
+    The Flask app keeps the main thread, so the socket servers share this
+    loop instead of a thread per connection or a worker pool.
+    """
 
-class ShipperCompleteHandler(socketserver.BaseRequestHandler):
-    def handle(self):
-        data = b""
-        while not data.endswith(b"\n"):
-            packet = self.request.recv(4096)
-            if not packet:
-                break
-            data += packet
-        logging.info("Received completion acknowledgment from receiver: %s", data.decode("utf-8").strip())
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[Thread] = None
+        self._servers: List[asyncio.AbstractServer] = []
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = Thread(target=self._loop.run_forever, name="socket-servers", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def serve(self, handler: FramedConnectionHandler, port: int):
+        """Start listening on port; returns once bound, raising if binding fails."""
+        future = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(handler, APP_HOST, port, backlog=LISTEN_BACKLOG),
+            self._ensure_loop(),
+        )
+        self._servers.append(future.result())
+
+    def close(self):
+        """Close every server and open connection, then stop the loop."""
+        with self._lock:
+            loop, thread, servers = self._loop, self._thread, self._servers
+            self._loop, self._thread, self._servers = None, None, []
+        if loop is None:
+            return
+
+        async def shutdown():
+            for server in servers:
+                server.close()
+            current = asyncio.current_task()
+            handlers = [task for task in asyncio.all_tasks() if task is not current]
+            for task in handlers:
+                task.cancel()
+            await asyncio.gather(*handlers, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+SOCKET_SERVERS = SocketServerLoop()
 
 
 def start_socket_server(handler_cls, port):
-    server = socketserver.ThreadingTCPServer((APP_HOST, port), handler_cls)
-    t = Thread(target=server.serve_forever, daemon=True)
-    t.start()
+    SOCKET_SERVERS.serve(handler_cls(), port)
     logging.info("Started socket server %s on port %d", handler_cls.__name__, port)
 
 
 # Flask REST API for carrier app and receiver
 app = Flask(__name__)
 
+# Bodies are encoded with orjson and handed to Flask as bytes, bypassing jsonify
+SUCCESS_BODY = orjson.dumps({"status": "success"})
+
+
+def json_response(body: bytes) -> Response:
+    return Response(body, mimetype="application/json")
+
 
 @app.route("/payloads/<tx_id>", methods=["GET"])
 def get_payload(tx_id):
-    payload = PAYLOAD_STORE.get(tx_id)
-    if not payload:
+    body = PAYLOAD_STORE.get_encoded(tx_id)
+    if body is None:
         abort(404)
-    return jsonify(payload)
+    return json_response(body)
 
 
 @app.route("/payloads", methods=["GET"])
 def list_payloads():
-    return jsonify(list(PAYLOAD_STORE.keys()))
+    return json_response(orjson.dumps(PAYLOAD_STORE.keys()))
 
 
 @app.route("/payloads/<tx_id>/delivered", methods=["POST"])
@@ -135,18 +384,22 @@ def mark_delivered(tx_id):
     payload = PAYLOAD_STORE.get(tx_id)
     if not payload:
         abort(404)
-    data = request.get_json()
+    try:
+        data = orjson.loads(request.get_data())
+    except orjson.JSONDecodeError:
+        abort(400, "invalid JSON body")
     receiver_signature = data.get("receiver_signature")
     if not receiver_signature:
         abort(400, "receiver_signature missing")
     payload["status"] = "DELIVERED"
     payload["delivered_timestamp"] = datetime.now(timezone.utc).isoformat()
     payload["receiver_signature"] = receiver_signature
+    PAYLOAD_STORE.put(tx_id, payload, orjson.dumps(payload))
     logging.info("Transaction %s marked as delivered.", tx_id)
     # Trigger mock SAP ERP call
     push_to_sap(payload)
     notify_shipper_completed(payload)
-    return jsonify({"status": "success"})
+    return json_response(SUCCESS_BODY)
 
 
 def push_to_sap(payload: Dict[str, Any]):
@@ -155,21 +408,90 @@ def push_to_sap(payload: Dict[str, Any]):
     # Real implementation would perform REST API call here.
 
 
+class CompletionNotifier:
+    """Sends completion notices to the shipper from one background thread.
+
+    Requests only enqueue the encoded notice, so a slow or unreachable
+    shipper never holds up the REST API. The sender keeps its connection
+    open between notices and reconnects when the shipper has closed it.
+    """
+
+    def __init__(self, host: str, port: int, maxsize: int = NOTIFY_QUEUE_SIZE):
+        self._address = (host, port)
+        self._queue: "queue.Queue[bytes]" = queue.Queue(maxsize=maxsize)
+        self._sock: Optional[socket.socket] = None
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def notify(self, message: bytes) -> bool:
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except queue.Full:
+            logging.error("Completion notice queue is full; dropping notice.")
+            return False
+
+    def _run(self):
+        while True:
+            message = self._queue.get()
+            try:
+                self._send(message)
+                logging.info("Notified shipper of delivery completion.")
+            except OSError as e:
+                logging.error("Failed to notify shipper: %s", e)
+                self._close()
+
+    def _send(self, message: bytes):
+        if self._sock is not None and self._peer_closed():
+            self._close()
+        if self._sock is not None:
+            try:
+                send_frame(self._sock, message)
+                return
+            except OSError:
+                self._close()
+        self._sock = socket.create_connection(self._address, timeout=5)
+        send_frame(self._sock, message)
+
+    def _peer_closed(self) -> bool:
+        # A send after the peer's FIN still succeeds and the notice is silently lost,
+        # so peek for EOF (e.g. the handler's idle timeout) before reusing the socket
+        timeout = self._sock.gettimeout()
+        self._sock.setblocking(False)
+        try:
+            return self._sock.recv(1, socket.MSG_PEEK) == b""
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+        finally:
+            self._sock.settimeout(timeout)
+
+    def _close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+COMPLETION_NOTIFIER = CompletionNotifier("localhost", BRIDGE_PORT_COMPLETE)
+
+
 def notify_shipper_completed(payload: Dict[str, Any]):
-    message = json.dumps({"transaction_id": payload["transaction_id"], "status": "DELIVERED"}).encode("utf-8") + b"\n"
-    try:
-        with socket.create_connection(("localhost", BRIDGE_PORT_COMPLETE), timeout=5) as sock:
-            sock.sendall(message)
-        logging.info("Notified shipper of delivery completion.")
-    except Exception as e:
-        logging.error("Failed to notify shipper: %s", e)
+    message = orjson.dumps({"transaction_id": payload["transaction_id"], "status": "DELIVERED"})
+    COMPLETION_NOTIFIER.notify(message)
 
 
 def main():
+    COMPLETION_NOTIFIER.start()
     start_socket_server(ShipperInitHandler, BRIDGE_PORT_INIT)
     start_socket_server(ShipperCompleteHandler, BRIDGE_PORT_COMPLETE)
     logging.info("Starting Flask app on port %d", APP_PORT)
-    app.run(host=APP_HOST, port=APP_PORT)
+    try:
+        app.run(host=APP_HOST, port=APP_PORT)
+    finally:
+        SOCKET_SERVERS.close()
 
 
 if __name__ == "__main__":
@@ -7,14 +7,20 @@ and sends them to the Blue Ships Sync bridge over a secure socket connection.
 """
 
 import socket
-import json
+import struct
+import threading
 import logging
 import os
-import base64
 import time
+import base64
 from datetime import datetime, timezone
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 
+import orjson
+try:
+    import pybase64
+except ImportError:
+    pybase64 = None
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding, rsa
 
@@ -27,6 +33,17 @@ PUBLIC_KEY_FILE = os.path.join(KEY_DIR, "shipper_public.pem")
 SHIPPER_ERP_ID = "SYTELINE-OH-001"
 RETRY_DELAY = 5  # seconds
 MAX_RETRIES = 5
+# Below this size the stdlib encoder is as fast as pybase64's SIMD path
+FAST_B64_MIN_SIZE = 256
+# Every socket message is a 4-byte big-endian length followed by the body
+FRAME_HEADER = struct.Struct(">I")
+# Largest body a peer may announce; anything bigger is refused before allocating for it
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+# sendmsg is missing on Windows
+HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+# Signature scheme shared with the bridge; built once and reused for every payload
+SIGNATURE_PADDING = padding.PKCS1v15()
+SIGNATURE_HASH = hashes.SHA256()
 
 logging.basicConfig(
     level=logging.INFO,
@@ -59,72 +76,181 @@ def ensure_keys() -> rsa.RSAPrivateKey:
     return private_key
 
 
+# Static part of the mock SyteLine order; nested values are shared, so treat them as read-only
+MOCK_ORDER_ITEMS = [
+    {"sku": "A1001", "description": "Blue Widget", "qty": 25, "weight_kg": 0.5},
+    {"sku": "B2002", "description": "Red Widget", "qty": 15, "weight_kg": 0.7}
+]
+MOCK_ORDER_TEMPLATE: Dict[str, Any] = {
+    "location": "Westerville, OH",
+    "packing_slip": {
+        "items": MOCK_ORDER_ITEMS,
+        "total_weight_kg": sum(item["qty"] * item["weight_kg"] for item in MOCK_ORDER_ITEMS)
+    },
+    "bol_number": "BOL-998877",
+    "batch_details": {
+        "batch_id": "BATCH-2308-01",
+        "manufacture_date": "2023-08-15",
+        "expiry_date": "2025-08-14"
+    },
+    "commercial_invoice": {
+        "number": "INV-556677",
+        "total_value": 18500,
+        "currency": "USD"
+    },
+    "pallet_count": 4,
+    "transit_type": "truck",
+    "shipper_erp_id": SHIPPER_ERP_ID,
+    "receiver_erp_id": "SAP-OH-009"
+}
+
+
 def get_mock_erp_data() -> Dict[str, Any]:
     """
     Simulates a call to Infor SyteLine ERP and returns shipping data.
     In production replace this with real ERP API calls.
     """
     logging.info("Fetching shipping order from Infor SyteLine ERP...")
-    return {
-        "transaction_id": f"TX-{int(time.time())}",
+    now = datetime.now(timezone.utc)
+    order = {
+        "transaction_id": f"TX-{int(now.timestamp())}",
         "status": "CREATED",
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "location": "Westerville, OH",
-        "packing_slip": {
-            "items": [
-                {"sku": "A1001", "description": "Blue Widget", "qty": 25, "weight_kg": 0.5},
-                {"sku": "B2002", "description": "Red Widget", "qty": 15, "weight_kg": 0.7}
-            ],
-            "total_weight_kg": 25 * 0.5 + 15 * 0.7
-        },
-        "bol_number": "BOL-998877",
-        "batch_details": {
-            "batch_id": "BATCH-2308-01",
-            "manufacture_date": "2023-08-15",
-            "expiry_date": "2025-08-14"
-        },
-        "commercial_invoice": {
-            "number": "INV-556677",
-            "total_value": 18500,
-            "currency": "USD"
-        },
-        "pallet_count": 4,
-        "transit_type": "truck",
-        "shipper_erp_id": SHIPPER_ERP_ID,
-        "receiver_erp_id": "SAP-OH-009"
+        "timestamp": now.isoformat(),
     }
+    order.update(MOCK_ORDER_TEMPLATE)
+    return order
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytearray]:
+    """Read exactly ``size`` bytes into one preallocated buffer.
+
+    Returns None if the peer closes the connection before sending anything;
+    a close part-way through raises ConnectionError.
+    """
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if not count:
+            if received == 0:
+                return None
+            raise ConnectionError("Connection closed mid-frame")
+        received += count
+    return buf
+
+
+def recv_frame(sock: socket.socket) -> Optional[bytearray]:
+    header = _recv_exact(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ConnectionError(f"Frame of {size} bytes exceeds the {MAX_FRAME_SIZE} byte limit")
+    body = _recv_exact(sock, size)
+    if body is None:
+        raise ConnectionError("Connection closed mid-frame")
+    return body
+
+
+def send_frame(sock: socket.socket, body: bytes) -> None:
+    header = FRAME_HEADER.pack(len(body))
+    if not HAS_SENDMSG:
+        sock.sendall(header + body)
+        return
+    # Gather-write header and body in one syscall without copying the body
+    sent = sock.sendmsg([header, body])
+    if sent < len(header):
+        sock.sendall(header[sent:])
+        sock.sendall(body)
+    elif sent < len(header) + len(body):
+        sock.sendall(memoryview(body)[sent - len(header):])
+
+
+def b64encode(data: bytes) -> bytes:
+    if pybase64 is not None and len(data) >= FAST_B64_MIN_SIZE:
+        return pybase64.b64encode(data)
+    return base64.b64encode(data)
 
 
 def sign_payload(private_key: rsa.RSAPrivateKey, payload_bytes: bytes) -> str:
     signature = private_key.sign(
         payload_bytes,
-        padding.PKCS1v15(),
-        hashes.SHA256()
+        SIGNATURE_PADDING,
+        SIGNATURE_HASH
     )
-    return base64.b64encode(signature).decode("utf-8")
+    return b64encode(signature).decode("utf-8")
 
 
-def build_payload(private_key: rsa.RSAPrivateKey) -> Dict[str, Any]:
+def build_payload(private_key: rsa.RSAPrivateKey) -> Tuple[Dict[str, Any], bytes]:
+    """Return the signed payload together with its wire encoding."""
     data = get_mock_erp_data()
-    payload_bytes = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    payload_bytes = orjson.dumps(data)
     signature = sign_payload(private_key, payload_bytes)
     data["digital_signature"] = signature
-    return data
+    # The signature goes last, so splice it into the bytes just signed rather than encoding twice
+    serialized = payload_bytes[:-1] + b',"digital_signature":' + orjson.dumps(signature) + b"}"
+    return data, serialized
+
+
+class BridgeConnection:
+    """One framed connection to the bridge, kept open across payloads.
+
+    Requests are serialized by a lock so replies always pair with their
+    request. If a reused connection turns out to be stale (the bridge
+    closes idle ones), it is replaced and the request retried once.
+    """
+
+    def __init__(self, host: str, port: int):
+        self._address = (host, port)
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+
+    def request(self, body: bytes) -> bytearray:
+        with self._lock:
+            if self._sock is not None:
+                try:
+                    return self._exchange(body)
+                except OSError:
+                    self._close()
+            self._sock = socket.create_connection(self._address, timeout=10)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            try:
+                return self._exchange(body)
+            except OSError:
+                self._close()
+                raise
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _exchange(self, body: bytes) -> bytearray:
+        send_frame(self._sock, body)
+        response = recv_frame(self._sock)
+        if response is None:
+            raise ConnectionError("Bridge closed the connection without responding")
+        return response
+
+    def _close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+BRIDGE = BridgeConnection(BRIDGE_HOST, BRIDGE_PORT_INIT)
 
 
-def send_payload(payload: Dict[str, Any]) -> None:
-    serialized = json.dumps(payload).encode("utf-8") + b"\n"
+def send_payload(serialized: bytes) -> None:
     attempts = 0
     while attempts < MAX_RETRIES:
         try:
-            with socket.create_connection((BRIDGE_HOST, BRIDGE_PORT_INIT), timeout=10) as sock:
-                sock.sendall(serialized)
-                ack = sock.recv(1024).decode().strip()
-                if ack == "ACK":
-                    logging.info("Payload acknowledged by bridge.")
-                    return
-                else:
-                    raise RuntimeError(f"Unexpected response from bridge: {ack}")
+            ack = BRIDGE.request(serialized).decode()
+            if ack == "ACK":
+                logging.info("Payload acknowledged by bridge.")
+                return
+            else:
+                raise RuntimeError(f"Unexpected response from bridge: {ack}")
         except Exception as e:
             attempts += 1
             logging.error("Failed to send payload (attempt %d/%d): %s",
@@ -135,6 +261,6 @@ def send_payload(payload: Dict[str, Any]) -> None:
 
 if __name__ == "__main__":
     private_key = ensure_keys()
-    payload = build_payload(private_key)
+    payload, serialized = build_payload(private_key)
     logging.info("Generated payload with transaction ID %s", payload["transaction_id"])
-    send_payload(payload)
\ No newline at end of file
+    send_payload(serialized)
\ No newline at end of file